@@ -0,0 +1,58 @@
+import os
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+"""
+Cached "is this CLI tool usable" check.
+`<tool> --version` 的成功结果按可执行文件路径与 mtime 缓存在 ~/.cache/youtube2bilibili/tools.json，
+工具未更换时后续运行无需再启动子进程。
+"""
+
+CACHE_FILE = Path.home() / ".cache" / "youtube2bilibili" / "tools.json"
+
+
+def _load() -> dict:
+    try:
+        with open(CACHE_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def _save(data: dict) -> None:
+    try:
+        CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = CACHE_FILE.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, CACHE_FILE)
+    except Exception:
+        pass
+
+
+def available(cmd: str) -> bool:
+    path = shutil.which(cmd)
+    if not path:
+        return False
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return False
+    cache = _load()
+    entry = cache.get(cmd)
+    if isinstance(entry, dict) and entry.get("path") == path and entry.get("mtime") == mtime and entry.get("ok"):
+        return True
+    try:
+        # 只看退出码，输出直接丢弃，不做捕获与解码
+        res = subprocess.run([path, "--version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        ok = res.returncode == 0
+    except Exception:
+        ok = False
+    # 只缓存成功结果：失败可能是暂时的，或依赖修好后无需更换可执行文件即可恢复
+    if ok:
+        cache[cmd] = {"path": path, "mtime": mtime, "ok": True}
+        _save(cache)
+    return ok
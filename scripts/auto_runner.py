@@ -4,22 +4,28 @@ import json
 import shutil
 import subprocess
 from pathlib import Path
-from typing import List
+from typing import List, Dict, Any, Optional, Set, TYPE_CHECKING
 from datetime import datetime, timedelta
 import time
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from dataclasses import dataclass, field
 
 # Ensure project root is on sys.path for `services` imports
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from services.youtube_search import search_videos
-from services.videolingo_client import VideoLingoClient
-from services.openai_title_tags import AITitleTagger
-from services.bilibili_check import check_duplicate
-from services.history_store import load_history_ids, append_history
-from services.ai_client import AIClient
+from _tool_cache import available as tool_available
+
+# services 依赖 requests / lxml / openai 等较重的包，延迟到真正需要时再导入，
+# 没有关键词或 API 不可用时可以快速退出
+if TYPE_CHECKING:
+    from services.videolingo_client import VideoLingoClient
+    from services.openai_title_tags import AITitleTagger
+    from services.disk_cache import DiskCache
+    from services.history_store import HistoryStore, HistoryAppender
+    from services.ai_client import AIClient
 
 CONFIG_PATH = Path("config/settings.json")
 title_template = "[中字翻译] {title}"
@@ -41,26 +47,15 @@ def ensure_dirs(cfg):
         Path(p).mkdir(parents=True, exist_ok=True)
 
 
-def check_tool_available(cmd: str) -> bool:
-    try:
-        res = subprocess.run([cmd, "--version"], capture_output=True, text=True)
-        return res.returncode == 0
-    except Exception:
-        return False
-
-
-def wait_task_with_progress(api: VideoLingoClient, task_id: str, poll_sec: int = 3, timeout_sec: int = 36000):
-    """轮询任务状态：不显示进度条，仅在 step 变化时打印一行状态。"""
+def wait_task_with_progress(api: "VideoLingoClient", task_id: str, poll_sec: int = 3, timeout_sec: int = 36000):
+    """等待任务结束：不显示进度条，仅在 step 变化时打印一行状态。
+    优先订阅服务端推送（SSE），服务端不支持或连接中断时回退为轮询。
+    """
     start = time.time()
     last_step = None
-    while True:
-        try:
-            s = api.get_status(task_id)
-        except Exception:
-            # 静默网络抖动；稍后重试
-            time.sleep(min(10, poll_sec))
-            continue
 
+    def observe(s: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        nonlocal last_step
         status = s.get("status")
         prog = s.get("progress")
         step = s.get("current_step") or ""
@@ -82,6 +77,26 @@ def wait_task_with_progress(api: VideoLingoClient, task_id: str, poll_sec: int =
 
         if time.time() - start > timeout_sec:
             return {"status": "failed", "message": "超时", "progress": pct}
+        return None
+
+    for s in api.stream_status(task_id, deadline=start + timeout_sec):
+        done = observe(s)
+        if done is not None:
+            return done
+
+    while True:
+        try:
+            s = api.get_status(task_id)
+        except Exception:
+            # 静默网络抖动；稍后重试
+            if time.time() - start > timeout_sec:
+                return {"status": "failed", "message": "超时", "progress": 0}
+            time.sleep(min(10, poll_sec))
+            continue
+
+        done = observe(s)
+        if done is not None:
+            return done
 
         time.sleep(poll_sec)
 
@@ -89,26 +104,39 @@ def wait_task_with_progress(api: VideoLingoClient, task_id: str, poll_sec: int =
 def download_cover(youtube_url: str, out_dir: Path) -> Path:
     out_dir.mkdir(parents=True, exist_ok=True)
     out_path = out_dir / "cover.jpg"
-    if os.path.exists("cookies.txt"):
-        cmd = [
-            "yt-dlp",
-            "--skip-download",
-            "--write-thumbnail",
-            "--convert-thumbnails", "jpg",
-            "--cookies", "cookies.txt",
-            "-o", str(out_dir / "%(id)s.%(ext)s"),
-            youtube_url,
-        ]
+    try:
+        from yt_dlp import YoutubeDL
+    except ImportError:
+        YoutubeDL = None
+    if YoutubeDL is not None:
+        # 进程内调用 yt-dlp，省去每个候选启动一次 Python 解释器
+        opts: Dict[str, Any] = {
+            "skip_download": True,
+            "writethumbnail": True,
+            "quiet": True,
+            "no_warnings": True,
+            "outtmpl": str(out_dir / "%(id)s.%(ext)s"),
+            # 与 CLI 的 --convert-thumbnails 相同在 before_dl 阶段转换；skip_download 时 post_process 阶段不会执行
+            "postprocessors": [{"key": "FFmpegThumbnailsConvertor", "format": "jpg", "when": "before_dl"}],
+        }
+        if os.path.exists("cookies.txt"):
+            opts["cookiefile"] = "cookies.txt"
+        try:
+            with YoutubeDL(opts) as ydl:
+                ydl.extract_info(youtube_url, download=True)
+        except Exception as e:
+            print(f"  Cover download failed: {e}")
     else:
         cmd = [
             "yt-dlp",
             "--skip-download",
             "--write-thumbnail",
             "--convert-thumbnails", "jpg",
-            "-o", str(out_dir / "%(.id)s.%(ext)s"),
-            youtube_url,
         ]
-    subprocess.run(cmd, check=False)
+        if os.path.exists("cookies.txt"):
+            cmd += ["--cookies", "cookies.txt"]
+        cmd += ["-o", str(out_dir / "%(id)s.%(ext)s"), youtube_url]
+        subprocess.run(cmd, check=False)
     # pick first jpg
     for f in out_dir.glob("*.jpg"):
         return f
@@ -160,211 +188,358 @@ def upload_with_retry(cover: Path, source: str, title: str, desc: str, tags: Lis
     return False, code, out, err
 
 
-def main():
-    cfg = load_config()
-    ensure_dirs(cfg)
+@dataclass
+class RunContext:
+    """Shared state for one run; candidate workers only touch it through the helpers below."""
+    cfg: Dict[str, Any]
+    api: "VideoLingoClient"
+    ai: "AIClient"
+    tagger: "AITitleTagger"
+    processed: "HistoryStore"
+    history: "HistoryAppender"
+    min_dur: int
+    max_dur: int
+    blacklist: Set[str]
+    cutoff: datetime
+    cleanup_remote: bool
+    upload_attempts: int
+    upload_backoff: int
+    dup_cache: "DiskCache"
+    dup_cache_ttl: float
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    upload_gate: threading.Semaphore = field(default_factory=lambda: threading.Semaphore(1))
+    in_flight: Set[str] = field(default_factory=set)
+
+
+def _claim(ctx: RunContext, vid: str) -> bool:
+    """Reserve a video id for this worker; False if it is processed or already being handled."""
+    with ctx.lock:
+        if vid in ctx.processed or vid in ctx.in_flight:
+            return False
+        ctx.in_flight.add(vid)
+        return True
+
+
+def _release(ctx: RunContext, vid: str) -> None:
+    with ctx.lock:
+        ctx.in_flight.discard(vid)
+
+
+def _record(ctx: RunContext, rec: Dict[str, Any], mark_processed: bool = True) -> None:
+    """Queue a history record for the appender and optionally mark the id processed."""
+    ctx.history.add(rec)
+    if mark_processed and rec.get("yt_id"):
+        with ctx.lock:
+            ctx.processed.add(rec["yt_id"])
+
+
+def _passes_filters(v, ctx: RunContext, tag: str) -> bool:
+    """Cheap local filters; records the skip reason into history and returns False on rejection."""
+    if v.duration is not None and (v.duration < ctx.min_dur or v.duration > ctx.max_dur):
+        print(f"  [{tag}] Skip (duration out of range)")
+        # record skip into history
+        if v.id:
+            _record(ctx, {
+                "yt_id": v.id,
+                "yt_url": v.url,
+                "status": "skipped",
+                "reason": "duration_out_of_range",
+                "duration": v.duration,
+                "uploaded_at": datetime.utcnow().isoformat(),
+            })
+        return False
+    if v.uploader and v.uploader.lower() in ctx.blacklist:
+        print(f"  [{tag}] Skip (blacklisted channel)")
+        if v.id:
+            _record(ctx, {
+                "yt_id": v.id,
+                "yt_url": v.url,
+                "status": "skipped",
+                "reason": "blacklisted_channel",
+                "channel": v.uploader,
+                "uploaded_at": datetime.utcnow().isoformat(),
+            })
+        return False
+    if v.upload_date and len(v.upload_date) == 8:
+        try:
+            dt = datetime.strptime(v.upload_date, "%Y%m%d")
+            if dt < ctx.cutoff:
+                print(f"  [{tag}] Skip (too old)")
+                if v.id:
+                    _record(ctx, {
+                        "yt_id": v.id,
+                        "yt_url": v.url,
+                        "status": "skipped",
+                        "reason": "too_old",
+                        "upload_date": v.upload_date,
+                        "uploaded_at": datetime.utcnow().isoformat(),
+                    })
+                return False
+        except Exception:
+            pass
+    return True
 
-    api = VideoLingoClient(cfg["api_base"])
-    ai = AIClient(
-        base_url=cfg["openai"]["base_url"],
-        api_key=cfg["openai"]["api_key"],
-        model=cfg["openai"].get("model", "gpt-4o-mini"),
-    )
-    tagger = AITitleTagger(base_url=cfg["openai"]["base_url"], api_key=cfg["openai"]["api_key"], model=cfg["openai"].get("model", "gpt-4o-mini"))
 
-    # Tools check
-    if not check_tool_available("yt-dlp"):
-        print("未检测到 yt-dlp，请先安装：pip install -U yt-dlp")
+def _screen_keyword(kw: str, ctx: RunContext, max_n: int, region: str, full_metadata: bool) -> list:
+    """Search one keyword, apply filters and a single batched duplicate check.
+    Returns the claimed videos that should go on to translation and upload.
+    """
+    from services.youtube_search import search_videos
+    from services.bilibili_check import check_duplicate_batch
+    videos = search_videos(kw, max_results=max_n, region=region, full_metadata=full_metadata)
+    print(f"Searching: {kw} -> {len(videos)} results")
+    pending = []
+    for v in videos:
+        tag = v.id or v.title[:30]
+        print(f"- Candidate: {v.title}")
+        # skip processed
+        if v.id and not _claim(ctx, v.id):
+            print(f"  [{tag}] Skip (already processed)")
+            continue
+        if _passes_filters(v, ctx, tag):
+            pending.append(v)
+        elif v.id:
+            _release(ctx, v.id)
+
+    try:
+        verdicts = check_duplicate_batch([v.title for v in pending], translator=ctx.ai,
+                                         cache=ctx.dup_cache, cache_ttl_sec=ctx.dup_cache_ttl,
+                                         dup_lo=float(ctx.cfg.get("dup_lo", 0.2)), dup_hi=float(ctx.cfg.get("dup_hi", 0.85)),
+                                         pool_query=kw)
+    except Exception:
+        # 判重失败时放回已占用的 id，其他关键词搜到同一视频时仍可处理
+        for v in pending:
+            if v.id:
+                _release(ctx, v.id)
+        raise
+    accepted = []
+    for v, verdict in zip(pending, verdicts):
+        tag = v.id or v.title[:30]
+        if not verdict.get("duplicate"):
+            accepted.append(v)
+            continue
+        matched = verdict.get("matched") or []
+        if matched:
+            print(f"  [{tag}] Skip (duplicate found): {matched[0].get('title','')} -> {matched[0].get('url','')}")
+        else:
+            print(f"  [{tag}] Skip (duplicate found by AI verdict)")
+        # record duplicate verdict
+        if v.id:
+            _record(ctx, {
+                "yt_id": v.id,
+                "yt_url": v.url,
+                "status": "skipped",
+                "reason": "duplicate",
+                "verdict": verdict,
+                "uploaded_at": datetime.utcnow().isoformat(),
+            })
+            _release(ctx, v.id)
+    return accepted
+
+
+def _process_candidate(v, ctx: RunContext) -> None:
+    """Translate, tag and upload one screened candidate; releases its claim when done."""
+    try:
+        _run_candidate(v, ctx, v.id or v.title[:30])
+    finally:
+        if v.id:
+            _release(ctx, v.id)
+
+
+def _run_candidate(v, ctx: RunContext, tag: str) -> None:
+    cfg = ctx.cfg
+    api = ctx.api
+    # call API to process URL
+    task_id = api.process_url(
+        v.url,
+        target_language=cfg.get("target_language", "简体中文"),
+        source_language=None,
+        enable_dubbing=cfg.get("enable_dubbing", False),
+        burn_subtitles=cfg.get("burn_subtitles", True),
+        resolution=cfg.get("resolution", "1080"),
+    )
+    print(f"  [{tag}] Submitted, task={task_id}, waiting...")
+    res = wait_task_with_progress(api, task_id)
+    if res.get("status") != "completed":
+        print(f"  [{tag}] Task failed, skip.")
+        # 清理远端任务
+        if ctx.cleanup_remote:
+            api.delete_task(task_id)
         return
 
-    # Quick health check for API availability (fallback to /)
-    base = cfg["api_base"].rstrip('/')
-    ok = False
+    # download chinese subs for naming
+    work = Path(cfg["paths"]["uploads_cache"]) / task_id
+    work.mkdir(parents=True, exist_ok=True)
+
+    trans_srt = work / "trans.srt"
+    # choose dubbed or subtitled video to upload
+    out_video = work / ("output_dub.mp4" if cfg.get("enable_dubbing", False) else "output_sub.mp4")
+    # 字幕与视频同时下载；视频较大，走分片并发下载
+    with ThreadPoolExecutor(max_workers=2) as dl:
+        futs = [
+            dl.submit(api.download_file, task_id, "trans_srt", str(trans_srt)),
+            dl.submit(api.download_file_ranged, task_id,
+                      "video_dub" if cfg.get("enable_dubbing", False) else "video_sub", str(out_video)),
+        ]
+        wait(futs)
+    for fut in futs:
+        fut.result()
+
+    # read subs small chunk for AI
+    cn_sub_text = trans_srt.read_text(encoding="utf-8", errors="ignore")
+
+    # AI title + tags + desc
+    pack = ctx.tagger.generate(v.title, cn_sub_text)
+    title = title_template.format(title=pack.get("title", v.title)[:80])
+    tags = pack.get("tags", [])
+    desc = desc_template.format(title_zh=title, title_en=v.title, video_url=v.url, desc=pack.get("desc", "")[:2000])
+
+    # cover
+    cover_dir = Path(cfg["paths"]["covers"]) / task_id
+    cover = download_cover(v.url, cover_dir)
+    if not cover.exists():
+        print(f"  [{tag}] Cover not found; proceeding without it may fail.")
+
+    # upload via biliup; B 站对并发投稿限流，上传串行执行
+    with ctx.upload_gate:
+        ok, code, out, err = upload_with_retry(cover, v.url, title, desc, tags, str(out_video),
+                                               attempts=ctx.upload_attempts, backoff_sec=ctx.upload_backoff)
+    if ok:
+        print(f"  [{tag}] Uploaded successfully.")
+        # record history
+        _record(ctx, {
+            "yt_id": v.id,
+            "yt_url": v.url,
+            "title": title,
+            "tags": tags,
+            "desc": desc,
+            "uploaded_at": datetime.utcnow().isoformat(),
+            "task_id": task_id,
+        })
+    else:
+        print(f"  [{tag}] Upload failed after retries:")
+        print(err or out)
+        # record failure but do not mark processed so it can be retried in future runs
+        if v.id:
+            _record(ctx, {
+                "yt_id": v.id,
+                "yt_url": v.url,
+                "status": "upload_failed",
+                "reason": err or out,
+                "attempts": ctx.upload_attempts,
+                "uploaded_at": datetime.utcnow().isoformat(),
+                "task_id": task_id,
+            }, mark_processed=False)
+    # 清理远端任务
+    if ctx.cleanup_remote:
+        api.delete_task(task_id)
+
+
+def api_healthy(base: str) -> bool:
+    """Quick health check for API availability (fallback to /)."""
+    from services.http_session import build_session
+    http = build_session(retries=1)
     try:
-        r = requests.get(base + "/health", timeout=5)
+        r = http.get(base + "/health", timeout=5)
         r.raise_for_status()
-        ok = True
+        return True
     except Exception:
         try:
-            r2 = requests.get(base + "/", timeout=5)
+            r2 = http.get(base + "/", timeout=5)
             if r2.ok and ("VideoLingo" in r2.text or "docs" in r2.text):
-                ok = True
+                return True
         except Exception:
-            ok = False
-    if not ok:
-        print(f"无法连接到 VideoLingo API: {base}，请确认已启动或修改 config/settings.json 的 api_base。")
-        return
+            pass
+    return False
+
+
+def main():
+    cfg = load_config()
+    ensure_dirs(cfg)
 
     keywords = cfg.get("keywords", [])
     if not keywords:
         print("No keywords in config. Add 'keywords' array.")
         return
 
+    # Tools check
+    if not tool_available("yt-dlp"):
+        print("未检测到 yt-dlp，请先安装：pip install -U yt-dlp")
+        return
+
+    base = cfg["api_base"].rstrip('/')
+    if not api_healthy(base):
+        print(f"无法连接到 VideoLingo API: {base}，请确认已启动或修改 config/settings.json 的 api_base。")
+        return
+
+    from services.videolingo_client import VideoLingoClient
+    from services.openai_title_tags import AITitleTagger
+    from services.disk_cache import DiskCache
+    from services.history_store import HistoryStore, HistoryAppender
+    from services.ai_client import AIClient
+
+    api = VideoLingoClient(cfg["api_base"])
+    llm_cache = DiskCache(str(Path(cfg["paths"]["workspace"]) / "llm_cache"))
+    llm_cache_ttl = float(cfg.get("llm_cache_ttl_sec", 7 * 86400))
+    ai = AIClient(
+        base_url=cfg["openai"]["base_url"],
+        api_key=cfg["openai"]["api_key"],
+        model=cfg["openai"].get("model", "gpt-4o-mini"),
+        cache=llm_cache,
+        cache_ttl_sec=llm_cache_ttl,
+    )
+    tagger = AITitleTagger(base_url=cfg["openai"]["base_url"], api_key=cfg["openai"]["api_key"], model=cfg["openai"].get("model", "gpt-4o-mini"),
+                           cache=llm_cache, cache_ttl_sec=llm_cache_ttl)
+
     max_n = cfg["youtube"].get("max_results_per_keyword", 5)
-    min_dur = cfg["youtube"].get("min_duration_sec", 0)
-    max_dur = cfg["youtube"].get("max_duration_sec", 1000000)
-    blacklist = set([c.lower() for c in cfg["youtube"].get("blacklist_channels", [])])
+    region = cfg["youtube"].get("search_region", "US")
+    # 快速（flat）搜索不返回 upload_date，发布时间过滤会失效；默认保留完整元数据
+    full_metadata = bool(cfg["youtube"].get("full_metadata", True))
     days = cfg["youtube"].get("published_after_days", 365)
-    cutoff = datetime.utcnow() - timedelta(days=days)
     history_file = cfg.get("history_file", str(Path(cfg["paths"]["workspace"]) / "history.jsonl"))
-    processed = load_history_ids(history_file)
-    cleanup_remote = cfg.get("cleanup_remote", True)
-    upload_attempts = int(cfg.get("upload_retry_attempts", 3))
-    upload_backoff = int(cfg.get("upload_retry_backoff_sec", 20))
-
-    for kw in keywords:
-        print(f"Searching: {kw}")
-        videos = search_videos(kw, max_results=max_n, region=cfg["youtube"].get("search_region", "US"))
-        for v in videos:
-            print(f"- Candidate: {v.title}")
-            # skip processed
-            if v.id and v.id in processed:
-                print("  Skip (already processed)")
-                continue
-            # filters
-            if v.duration is not None and (v.duration < min_dur or v.duration > max_dur):
-                print("  Skip (duration out of range)")
-                # record skip into history
-                if v.id:
-                    append_history(history_file, {
-                        "yt_id": v.id,
-                        "yt_url": v.url,
-                        "status": "skipped",
-                        "reason": "duration_out_of_range",
-                        "duration": v.duration,
-                        "uploaded_at": datetime.utcnow().isoformat(),
-                    })
-                    processed.add(v.id)
-                continue
-            if v.uploader and v.uploader.lower() in blacklist:
-                print("  Skip (blacklisted channel)")
-                if v.id:
-                    append_history(history_file, {
-                        "yt_id": v.id,
-                        "yt_url": v.url,
-                        "status": "skipped",
-                        "reason": "blacklisted_channel",
-                        "channel": v.uploader,
-                        "uploaded_at": datetime.utcnow().isoformat(),
-                    })
-                    processed.add(v.id)
-                continue
-            if v.upload_date and len(v.upload_date) == 8:
+    ctx = RunContext(
+        cfg=cfg,
+        api=api,
+        ai=ai,
+        tagger=tagger,
+        processed=HistoryStore(history_file),
+        history=HistoryAppender(history_file),
+        min_dur=cfg["youtube"].get("min_duration_sec", 0),
+        max_dur=cfg["youtube"].get("max_duration_sec", 1000000),
+        blacklist=set([c.lower() for c in cfg["youtube"].get("blacklist_channels", [])]),
+        cutoff=datetime.utcnow() - timedelta(days=days),
+        cleanup_remote=cfg.get("cleanup_remote", True),
+        upload_attempts=int(cfg.get("upload_retry_attempts", 3)),
+        upload_backoff=int(cfg.get("upload_retry_backoff_sec", 20)),
+        dup_cache=DiskCache(str(Path(cfg["paths"]["workspace"]) / "dup_cache")),
+        dup_cache_ttl=float(cfg.get("dup_cache_ttl_sec", 86400)),
+    )
+    search_workers = max(1, min(int(cfg.get("search_concurrency", 4)), len(keywords)))
+    workers = max(1, int(cfg.get("concurrency", 4)))
+
+    try:
+        # 搜索与候选处理都是 I/O 密集型：关键词并发搜索并批量判重，通过的候选陆续投入处理线程池
+        with ThreadPoolExecutor(max_workers=search_workers) as search_pool, \
+                ThreadPoolExecutor(max_workers=workers) as work_pool:
+            searches = {search_pool.submit(_screen_keyword, kw, ctx, max_n, region, full_metadata): kw for kw in keywords}
+            jobs = []
+            for fut in as_completed(searches):
+                kw = searches[fut]
                 try:
-                    dt = datetime.strptime(v.upload_date, "%Y%m%d")
-                    if dt < cutoff:
-                        print("  Skip (too old)")
-                        if v.id:
-                            append_history(history_file, {
-                                "yt_id": v.id,
-                                "yt_url": v.url,
-                                "status": "skipped",
-                                "reason": "too_old",
-                                "upload_date": v.upload_date,
-                                "uploaded_at": datetime.utcnow().isoformat(),
-                            })
-                            processed.add(v.id)
-                        continue
-                except Exception:
-                    pass
-            verdict = check_duplicate(v.title, translator=ai)
-            if verdict.get("duplicate"):
-                matched = verdict.get("matched") or []
-                if matched:
-                    print(f"  Skip (duplicate found): {matched[0].get('title','')} -> {matched[0].get('url','')}")
-                else:
-                    print("  Skip (duplicate found by AI verdict)")
-                # record duplicate verdict
-                if v.id:
-                    rec = {
-                        "yt_id": v.id,
-                        "yt_url": v.url,
-                        "status": "skipped",
-                        "reason": "duplicate",
-                        "verdict": verdict,
-                        "uploaded_at": datetime.utcnow().isoformat(),
-                    }
-                    append_history(history_file, rec)
-                    processed.add(v.id)
-                continue
-
-            # call API to process URL
-            task_id = api.process_url(
-                v.url,
-                target_language=cfg.get("target_language", "简体中文"),
-                source_language=None,
-                enable_dubbing=cfg.get("enable_dubbing", False),
-                burn_subtitles=cfg.get("burn_subtitles", True),
-                resolution=cfg.get("resolution", "1080"),
-            )
-            print(f"  Submitted, task={task_id}, waiting...")
-            res = wait_task_with_progress(api, task_id)
-            if res.get("status") != "completed":
-                print("  Task failed, skip.")
-                # 清理远端任务
-                if cleanup_remote:
-                    api.delete_task(task_id)
-                continue
-
-            # download chinese subs for naming
-            work = Path(cfg["paths"]["uploads_cache"]) / task_id
-            work.mkdir(parents=True, exist_ok=True)
-
-            trans_srt = work / "trans.srt"
-            api.download_file(task_id, "trans_srt", str(trans_srt))
-
-            # choose dubbed or subtitled video to upload
-            out_video = work / ("output_dub.mp4" if cfg.get("enable_dubbing", False) else "output_sub.mp4")
-            api.download_file(task_id, "video_dub" if cfg.get("enable_dubbing", False) else "video_sub", str(out_video))
-
-            # read subs small chunk for AI
-            cn_sub_text = trans_srt.read_text(encoding="utf-8", errors="ignore")
-
-            # AI title + tags + desc
-            pack = tagger.generate(v.title, cn_sub_text)
-            title = title_template.format(title=pack.get("title", v.title)[:80])
-            tags = pack.get("tags", [])
-            desc = desc_template.format(title_zh=title, title_en=v.title, video_url=v.url, desc=pack.get("desc", "")[:2000])
-
-            # cover
-            cover_dir = Path(cfg["paths"]["covers"]) / task_id
-            cover = download_cover(v.url, cover_dir)
-            if not cover.exists():
-                print("  Cover not found; proceeding without it may fail.")
-
-            # upload via biliup
-            ok, code, out, err = upload_with_retry(cover, v.url, title, desc, tags, str(out_video),
-                                                   attempts=upload_attempts, backoff_sec=upload_backoff)
-            if ok:
-                print("  Uploaded successfully.")
-                # record history
-                append_history(history_file, {
-                    "yt_id": v.id,
-                    "yt_url": v.url,
-                    "title": title,
-                    "tags": tags,
-                    "desc": desc,
-                    "uploaded_at": datetime.utcnow().isoformat(),
-                    "task_id": task_id,
-                })
-                processed.add(v.id)
-            else:
-                print("  Upload failed after retries:")
-                print(err or out)
-                # record failure but do not mark processed so it can be retried in future runs
-                if v.id:
-                    append_history(history_file, {
-                        "yt_id": v.id,
-                        "yt_url": v.url,
-                        "status": "upload_failed",
-                        "reason": err or out,
-                        "attempts": upload_attempts,
-                        "uploaded_at": datetime.utcnow().isoformat(),
-                        "task_id": task_id,
-                    })
-            # 清理远端任务
-            if cleanup_remote:
-                api.delete_task(task_id)
+                    videos = fut.result()
+                except Exception as e:
+                    print(f"Search failed: {kw} ({e})")
+                    continue
+                for v in videos:
+                    jobs.append(work_pool.submit(_process_candidate, v, ctx))
+            for fut in as_completed(jobs):
+                try:
+                    fut.result()
+                except Exception as e:
+                    print(f"  Candidate failed: {e}")
+    finally:
+        ctx.history.close()
+        ctx.processed.close()
 
 
 if __name__ == "__main__":
@@ -1,20 +1,72 @@
-from typing import List, Dict, Optional, cast, Any, Callable
+from typing import List, Dict, Optional, Tuple, cast, Any, Callable
 from openai import OpenAI
 from openai.types.chat import ChatCompletionMessageParam
+import os
+import json
 import time
+import hashlib
+import inspect
+import functools
 
+from .disk_cache import DiskCache
+from .sub_sample import sample_srt
+
+# 固定的系统提示放在最前面，候选之间保持字节一致，便于服务端前缀缓存命中
 TITLE_TAGS_PROMPT = """
-你是资深的新媒体编辑。根据提供的视频原标题与中文字幕，生成：
+你是精通 B 站风格的资深中文新媒体编辑。根据提供的视频原标题与中文字幕，生成：
 1) 一个吸引人的中文标题（限制 20 字内，避免夸张词）。
 2) 8-12 个中文标签（每个 2-4 字）。
 3) 一段简洁描述（80-150 字），自然口语、避免重复。
 
-返回 JSON：{{"title":"...","tags":[".."],"desc":"..."}}
-原标题：{orig}
+返回 JSON：{"title":"...","tags":[".."],"desc":"..."}
+仅输出 JSON 对象，字段为 title/tags/desc。
+"""
+
+TITLE_TAGS_INPUT = """原标题：{orig}
 字幕：\n{subs}
 """
 
 
+def disk_memoize(key_args: Optional[Callable[..., Any]] = None, valid: Callable[[Any], bool] = bool):
+    """Memoize an AIClient method in self.cache (a DiskCache) for self.cache_ttl seconds.
+    The key is sha1(model|method|arguments); key_args may map the call arguments to the
+    part that should be hashed. Only results for which valid(result) is true are stored
+    (or served from the cache). No-op when the client has no cache or Y2B_CACHE=off.
+    """
+    def deco(fn: Callable[..., Any]) -> Callable[..., Any]:
+        sig = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            cache = getattr(self, "cache", None)
+            if cache is None or os.environ.get("Y2B_CACHE", "").lower() == "off":
+                return fn(self, *args, **kwargs)
+            bound = sig.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            params = {k: v for k, v in bound.arguments.items() if k != "self"}
+            parts = key_args(**params) if key_args else params
+            raw = f"{self.model}|{fn.__name__}|{json.dumps(parts, ensure_ascii=False, sort_keys=True)}"
+            key = "llm:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+            hit = cache.get(key)
+            if hit is not None and valid(hit):
+                return hit
+            value = fn(self, *args, **kwargs)
+            if valid(value):
+                cache.set(key, value, expire=self.cache_ttl)
+            return value
+        return wrapper
+    return deco
+
+
+def _valid_translation(value: Any) -> bool:
+    return isinstance(value, str) and bool(value.strip())
+
+
+def _valid_title_tags(value: Any) -> bool:
+    # chat_json 的 {"error": ...} 兜底回复等缺少 title/tags 的结果不应被缓存
+    return isinstance(value, dict) and bool(value.get("title")) and isinstance(value.get("tags"), list)
+
+
 class AIClient:
     def __init__(
         self,
@@ -25,6 +77,8 @@ class AIClient:
         total_timeout_sec: float = 600.0,
         retries: int = 10,
         retry_backoff_sec: float = 5.0,
+        cache: Optional[DiskCache] = None,
+        cache_ttl_sec: float = 7 * 86400,
     ):
         # set small client-level retry to 0; we handle retries ourselves
         self.client = OpenAI(base_url=base_url, api_key=api_key, max_retries=0)
@@ -33,6 +87,9 @@ class AIClient:
         self.total_timeout = float(total_timeout_sec)
         self.max_retries = int(retries)
         self.retry_backoff = float(retry_backoff_sec)
+        # 可选的磁盘缓存：相同输入的翻译/标题生成在重跑时不再请求模型
+        self.cache = cache
+        self.cache_ttl = float(cache_ttl_sec)
 
     def chat(self, messages: List[Dict[str, str]], temperature: float = 0.7) -> str:
         c = self.client.with_options(timeout=self.request_timeout)
@@ -81,6 +138,83 @@ class AIClient:
                         pass
         return "".join(buf_parts).strip()
 
+    def chat_stream_json(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        on_delta: Optional[Callable[[str], None]] = None,
+    ) -> Tuple[str, Any]:
+        """Like chat_stream, but stops reading as soon as a complete top-level JSON value has arrived.
+        Returns (text, parsed); parsed is None if no complete value was seen before the stream ended.
+        """
+        c = self.client.with_options(timeout=self.request_timeout)
+        start = time.monotonic()
+        buf_parts: List[str] = []
+        dec = json.JSONDecoder()
+        # 在线括号计数：depth 回到 0 时尝试解析，成功即关闭流
+        pos = 0
+        begin = -1
+        depth = 0
+        in_str = False
+        esc = False
+        stream = c.chat.completions.create(
+            model=self.model,
+            messages=cast(List[ChatCompletionMessageParam], messages),
+            temperature=temperature,
+            stream=True,
+        )
+        try:
+            for ev in stream:
+                # total timeout guard
+                if (time.monotonic() - start) > self.total_timeout:
+                    raise TimeoutError(f"AI 流式请求超时（> {self.total_timeout}s）")
+                try:
+                    delta = ev.choices[0].delta
+                    piece = getattr(delta, "content", None)
+                except Exception:
+                    piece = None
+                if not piece:
+                    continue
+                buf_parts.append(piece)
+                if on_delta:
+                    try:
+                        on_delta(piece)
+                    except Exception:
+                        pass
+                for ch in piece:
+                    if begin < 0:
+                        if ch in "{[":
+                            begin, depth = pos, 1
+                    elif in_str:
+                        if esc:
+                            esc = False
+                        elif ch == "\\":
+                            esc = True
+                        elif ch == '"':
+                            in_str = False
+                    elif ch == '"':
+                        in_str = True
+                    elif ch in "{[":
+                        depth += 1
+                    elif ch in "}]":
+                        depth -= 1
+                        if depth == 0:
+                            text = "".join(buf_parts)
+                            try:
+                                return text.strip(), dec.raw_decode(text, begin)[0]
+                            except json.JSONDecodeError:
+                                # 不是合法 JSON，继续寻找下一个起始括号
+                                begin = -1
+                    pos += 1
+        finally:
+            close = getattr(stream, "close", None)
+            if close:
+                try:
+                    close()
+                except Exception:
+                    pass
+        return "".join(buf_parts).strip(), None
+
     def chat_json(self, messages: List[Dict[str, str]], temperature: float = 0.5, retries: Optional[int] = None, stream: bool = True,
                   on_stream: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """Ask model to return pure JSON and parse it with retry.
@@ -99,16 +233,19 @@ class AIClient:
         backoff = self.retry_backoff
         start = time.monotonic()
         for i in range(max_tries):
+            txt: Optional[str] = None
             try:
                 remaining = self.total_timeout - (time.monotonic() - start)
                 if remaining <= 0:
                     raise TimeoutError(f"AI 请求总超时（> {self.total_timeout}s），已放弃。")
                 print(f"AI 请求尝试 {i + 1}/{max_tries}...")
+                data: Any = None
                 if stream:
-                    txt = self.chat_stream(msgs, temperature=temperature, on_delta=on_stream)
+                    txt, data = self.chat_stream_json(msgs, temperature=temperature, on_delta=on_stream)
                 else:
                     txt = self.chat(msgs, temperature=temperature)
-                data = self._extract_json(txt)
+                if data is None:
+                    data = self._extract_json(txt)
                 if isinstance(data, dict):
                     return data
                 # 如果解析出的是数组，包一层
@@ -117,11 +254,13 @@ class AIClient:
             except Exception as e:
                 last_err = e
                 print(f"AI 请求失败: {e}")
-                # 追加提醒并重试
-                msgs.append({
-                    "role": "system",
-                    "content": "请仅输出 JSON 对象，不要附加说明或 Markdown。",
-                })
+                # 追加提醒并重试：把上次回复和提醒接在末尾，不改动 system 前缀，以免破坏服务端前缀缓存
+                if txt is not None:
+                    msgs.append({"role": "assistant", "content": txt})
+                    msgs.append({
+                        "role": "user",
+                        "content": "上一次输出不是合法 JSON。请仅输出 JSON 对象，不要附加说明或 Markdown。",
+                    })
                 if i < max_tries - 1:
                     time.sleep(min(backoff, max(0.0, self.total_timeout)))
                     backoff = min(backoff * 2, 60.0)
@@ -131,22 +270,17 @@ class AIClient:
 
     @staticmethod
     def _extract_json(text: str) -> Any:
-        import json, re
-        # 尝试直接解析
-        try:
-            return json.loads(text)
-        except Exception:
-            pass
-        # 提取第一个花括号 JSON
-        m = re.search(r"\{[\s\S]*\}", text)
-        if m:
-            return json.loads(m.group(0))
-        # 提取数组
-        m2 = re.search(r"\[[\s\S]*\]", text)
-        if m2:
-            return json.loads(m2.group(0))
+        # 线性扫描：从每个 { 或 [ 起尝试 raw_decode，取第一个完整的 JSON 值（忽略前后多余文字）
+        dec = json.JSONDecoder()
+        for i, ch in enumerate(text):
+            if ch in "{[":
+                try:
+                    return dec.raw_decode(text, i)[0]
+                except json.JSONDecodeError:
+                    continue
         raise ValueError("无法从模型输出中解析 JSON")
 
+    @disk_memoize(valid=_valid_translation)
     def translate_title_to_zh(self, title: str) -> str:
         if not title:
             return title
@@ -156,11 +290,12 @@ class AIClient:
         ], temperature=0.3)
         return cast(str, data.get("zh", ""))
 
+    @disk_memoize(lambda original_title, cn_subs: [original_title, cn_subs.encode("utf-8")[:512].decode("utf-8", errors="ignore")],
+                  valid=_valid_title_tags)
     def generate_title_tags(self, original_title: str, cn_subs: str) -> Dict:
-        prompt = TITLE_TAGS_PROMPT.format(orig=original_title, subs=cn_subs[:6000])
         data = self.chat_json([
-            {"role": "system", "content": "你是精通 B 站风格的中文新媒体编辑。"},
-            {"role": "user", "content": prompt + "\n仅输出 JSON 对象，字段为 title/tags/desc。"},
+            {"role": "system", "content": TITLE_TAGS_PROMPT},
+            {"role": "user", "content": TITLE_TAGS_INPUT.format(orig=original_title, subs=sample_srt(cn_subs))},
         ], temperature=0.7)
         return data
 
@@ -169,7 +304,6 @@ class AIClient:
         Ask AI to determine if candidates contain reuploads of the video by title.
         Return JSON: {"duplicate": bool, "reason": str, "matched": [{"title":..., "url":...}]}
         """
-        import json
         msg = (
             "请根据原标题(可能为英文)与其中文译文，判断候选列表中是否存在相同或高度相似/同源的搬运。"
             "考虑缩写、序号、机翻差异、标点与空格、B站常见风格化等。"
@@ -179,13 +313,55 @@ class AIClient:
             {"role": "system", "content": "你是内容审核与文本比对专家。"},
             {"role": "user", "content": msg + f"\n原标题: {original_title}\n中文译: {zh_title}\n候选列表(JSON 数组)：\n" + json.dumps(candidates, ensure_ascii=False)},
         ], temperature=0.2)
-        # 兜底字段
-        if "duplicate" not in data:
+        # 兜底字段；没有给出布尔结论（含 {"error": ...} 回复）时标记为 failed
+        if not isinstance(data.get("duplicate"), bool):
+            data["failed"] = True
             data["duplicate"] = False
+            if data.get("error"):
+                data.setdefault("reason", f"AI 拒绝判重: {data['error']}")
         if "matched" not in data:
             data["matched"] = []
         if "reason" not in data:
             data["reason"] = ""
         return data
 
+    def judge_duplicates_batch(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Batch version of judge_duplicate: one request for several source videos.
+        items: [{"orig": str, "zh": str, "candidates": [{"title":..., "url":...}]}]
+        Returns one verdict per item, aligned by index; items the model did not answer
+        validly carry ``"failed": True``.
+        """
+        if not items:
+            return []
+        msg = (
+            "对下列数组中每个对象判断：根据原标题 orig(可能为英文)与其中文译文 zh，"
+            "其 candidates 列表中是否存在相同或高度相似/同源的搬运。"
+            "考虑缩写、序号、机翻差异、标点与空格、B站常见风格化等。"
+            "输出 JSON：{\"results\":[{\"duplicate\":true|false,\"reason\":\"...\",\"matched\":[{\"title\":\"...\",\"url\":\"...\"}]}]}，"
+            "results 与输入数组按下标一一对应，长度相同。"
+        )
+        data = self.chat_json([
+            {"role": "system", "content": "你是内容审核与文本比对专家。"},
+            {"role": "user", "content": msg + "\n输入数组(JSON)：\n" + json.dumps(items, ensure_ascii=False)},
+        ], temperature=0.2)
+        raw = data.get("results")
+        if raw is None:
+            raw = data.get("list") or []
+        if not isinstance(raw, list):
+            raw = []
+        missing = f"AI 拒绝判重: {data['error']}" if data.get("error") else "AI 未返回该项结果"
+        verdicts: List[Dict[str, Any]] = []
+        for i in range(len(items)):
+            v = raw[i] if i < len(raw) else None
+            if not isinstance(v, dict) or not isinstance(v.get("duplicate"), bool):
+                # 缺失或格式不对的项标记为 failed，调用方不应把它当作真实结论缓存
+                verdicts.append({"duplicate": False, "matched": [], "reason": missing, "failed": True})
+                continue
+            # 兜底字段
+            v.setdefault("matched", [])
+            v.setdefault("reason", "")
+            verdicts.append(v)
+        return verdicts
+
 
@@ -1,19 +1,70 @@
 import re
 import time
+import hashlib
+import functools
+from collections import Counter, OrderedDict, defaultdict
 import urllib.parse
-import requests
 from html import unescape
+import threading
+from lxml import etree
 from lxml import html as lxml_html
 from dataclasses import dataclass
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, FrozenSet, Set, Tuple
 
 from .ai_client import AIClient
+from .disk_cache import DiskCache
+from .http_session import build_session
 
 """
 Simple duplicate check against Bilibili by searching the title on B 站的搜索页。
 不依赖官方 API，仅做粗略相似度判断，命中则认为重复。
 """
 
+# 复用连接（keep-alive），并发判重时多个线程共享连接池
+_SESSION = build_session(
+    pool_connections=32,
+    pool_maxsize=32,
+    headers={"User-Agent": "Mozilla/5.0", "Accept-Encoding": "gzip"},
+)
+
+
+# 条件请求缓存（内存 LRU）：query -> (ETag, Last-Modified, 已解析候选, 时间)
+# 按写入/确认时间排序，5 分钟过期，最多保留 _ETAG_MAX_ENTRIES 条
+_ETAG_TTL_SEC = 300
+_ETAG_MAX_ENTRIES = 256
+_etag_cache: "OrderedDict[str, Tuple[Optional[str], Optional[str], List[Dict[str, str]], float]]" = OrderedDict()
+_etag_lock = threading.Lock()
+
+
+def _etag_store(query_title: str, entry: Tuple[Optional[str], Optional[str], List[Dict[str, str]], float]) -> None:
+    now = entry[3]
+    with _etag_lock:
+        _etag_cache[query_title] = entry
+        _etag_cache.move_to_end(query_title)
+        # 最旧的条目在前：先清掉过期的，再按容量淘汰
+        while _etag_cache:
+            oldest = next(iter(_etag_cache.values()))
+            if now - oldest[3] <= _ETAG_TTL_SEC and len(_etag_cache) <= _ETAG_MAX_ENTRIES:
+                break
+            _etag_cache.popitem(last=False)
+
+# 预编译 XPath，避免每个候选卡片重复编译表达式
+_XP_H3 = etree.XPath('//h3[contains(@class, "bili-video-card__info--tit")]')
+_XP_CARD_A = etree.XPath('ancestor::div[contains(@class, "bili-video-card")][1]//a[starts-with(@href, "//www.bilibili.com/video/")][1]/@href')
+_XP_ANC_A = etree.XPath('ancestor::a[starts-with(@href, "//www.bilibili.com/video/")][1]/@href')
+_XP_FOLL_A = etree.XPath('following::a[starts-with(@href, "//www.bilibili.com/video/")][1]/@href')
+
+# lxml 解析器不能跨线程共享，每个线程各持一个
+_parsers = threading.local()
+
+
+def _html_parser() -> "lxml_html.HTMLParser":
+    p = getattr(_parsers, "p", None)
+    if p is None:
+        p = _parsers.p = lxml_html.HTMLParser(encoding="utf-8")
+    return p
+
+
 @dataclass
 class BiliSearchResult:
     url: str
@@ -21,82 +72,277 @@ class BiliSearchResult:
     uploader: Optional[str]
 
 
-def similar(a: str, b: str) -> float:
-    """Jaccard similarity over token sets.
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+")
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]")
+
+
+@functools.lru_cache(maxsize=4096)
+def _tok(s: str) -> FrozenSet[str]:
+    """Token set of a title, cached since the same titles are compared many times.
     - English/number tokens: \\w+
     - Chinese characters treated as single-char tokens
     """
-    def tok(s: str):
-        # extract ascii words
-        words = re.findall(r"[A-Za-z0-9_]+", s)
-        # extract CJK chars
-        cjk = re.findall(r"[\u4e00-\u9fff]", s)
-        return {t.lower() for t in words} | set(cjk)
-    A, B = tok(a or ""), tok(b or "")
+    return frozenset(t.lower() for t in _WORD_RE.findall(s)) | frozenset(_CJK_RE.findall(s))
+
+
+def similar(a: str, b: str) -> float:
+    """Jaccard similarity over token sets (see _tok)."""
+    A, B = _tok(a or ""), _tok(b or "")
     if not A or not B:
         return 0.0
     return len(A & B) / len(A | B)
 
 
-def check_duplicate(title: str, translator: Optional[AIClient] = None) -> Dict[str, Any]:
+def rank_similar(query: str, titles: List[str], limit: Optional[int] = None,
+                 cutoff: float = 0.0) -> List[Tuple[int, float]]:
+    """Score many titles against one query in a single sweep.
+    Returns [(index, similarity)] best first, dropping scores below cutoff.
     """
-    AI 判重流程：
-    1) 先将原标题翻译为中文（若 translator 提供）。
-    2) 用 lxml 抓取 B 站搜索页，收集候选 [{title,url}]。
-    3) 让 AI 判断是否为重复搬运，返回 JSON：
-       {"duplicate": bool, "reason": str, "matched": [{"title":..., "url":...}],
-        "zh_title": str, "candidates": [...]}。
+    Q = _tok(query or "")
+    if not Q:
+        return []
+    scored: List[Tuple[int, float]] = []
+    for i, t in enumerate(titles):
+        T = _tok(t or "")
+        inter = len(Q & T)
+        if not inter:
+            continue
+        score = inter / (len(Q) + len(T) - inter)
+        if score >= cutoff:
+            scored.append((i, score))
+    scored.sort(key=lambda x: x[1], reverse=True)
+    return scored[:limit] if limit else scored
+
+
+class CandidateIndex:
+    """Inverted token index over a pool of Bilibili candidates (e.g. one search per keyword).
+    Lets each source title find overlapping candidates by intersecting posting lists
+    instead of scanning the whole pool.
     """
-    zh_title: Optional[str] = None
-    if translator:
-        try:
-            print("翻译标题...")
-            zh_title = translator.translate_title_to_zh(title)
-        except Exception:
-            zh_title = None
-    print(f"翻译结果: {zh_title},爬取B站...")
-    query_title = zh_title or title
 
+    def __init__(self, candidates: List[Dict[str, str]]):
+        self.candidates = candidates
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+        for i, c in enumerate(candidates):
+            for t in _tok(c.get("title") or ""):
+                self._postings[t].add(i)
+
+    def top(self, title: str, k: int = 10) -> List[Dict[str, str]]:
+        """Candidates sharing the most tokens with title; ties favour shorter titles."""
+        scores: Counter = Counter()
+        for t in _tok(title or ""):
+            scores.update(self._postings.get(t, ()))
+        ranked = sorted(scores.items(), key=lambda kv: (-kv[1], len(_tok(self.candidates[kv[0]].get("title") or ""))))
+        return [self.candidates[i] for i, _ in ranked[:k]]
+
+
+def _cache_key(prefix: str, text: str) -> str:
+    return prefix + ":" + hashlib.sha1(text.strip().lower().encode("utf-8")).hexdigest()
+
+
+def _translate(title: str, translator: Optional[AIClient]) -> Optional[str]:
+    # 译文缓存由 AIClient 自身负责（见 ai_client.disk_memoize）
+    if not translator:
+        return None
+    try:
+        print("翻译标题...")
+        return translator.translate_title_to_zh(title)
+    except Exception:
+        return None
+
+
+def search_bilibili(query_title: str) -> List[Dict[str, str]]:
+    """用 lxml 抓取 B 站搜索页，返回候选 [{title,url}]；失败时返回空列表。"""
     candidates: List[Dict[str, str]] = []
     try:
         q = urllib.parse.quote_plus(query_title)
         url = f"https://search.bilibili.com/all?keyword={q}"
-        headers = {"User-Agent": "Mozilla/5.0"}
-        r = requests.get(url, headers=headers, timeout=10)
+        headers: Dict[str, str] = {}
+        now = time.monotonic()
+        with _etag_lock:
+            cached = _etag_cache.get(query_title)
+            if cached and now - cached[3] > _ETAG_TTL_SEC:
+                del _etag_cache[query_title]
+                cached = None
+        if cached:
+            if cached[0]:
+                headers["If-None-Match"] = cached[0]
+            if cached[1]:
+                headers["If-Modified-Since"] = cached[1]
+        r = _SESSION.get(url, headers=headers, timeout=10)
+        if r.status_code == 304 and cached:
+            # 页面未变化：复用上次解析结果，跳过下载与解析；刷新时间并移到 LRU 末尾
+            _etag_store(query_title, (cached[0], cached[1], cached[2], now))
+            return list(cached[2])
         r.raise_for_status()
-        doc = lxml_html.fromstring(r.text)
+        # 直接解析字节，省去 r.text 的解码
+        doc = lxml_html.fromstring(r.content, parser=_html_parser())
 
         # 找所有标题 h3
-        nodes = doc.xpath('//h3[contains(@class, "bili-video-card__info--tit")]')
+        nodes = _XP_H3(doc)
         for h3 in nodes:
             cand_title = (h3.get('title') or h3.text_content() or '').strip()
             if not cand_title:
                 continue
             # 在所在卡片范围内找视频链接
             href = None
-            card_a = h3.xpath('ancestor::div[contains(@class, "bili-video-card")][1]//a[starts-with(@href, "//www.bilibili.com/video/")][1]/@href')
+            card_a = _XP_CARD_A(h3)
             if card_a:
                 href = card_a[0]
             else:
-                anc_a = h3.xpath('ancestor::a[starts-with(@href, "//www.bilibili.com/video/")][1]/@href')
+                anc_a = _XP_ANC_A(h3)
                 if anc_a:
                     href = anc_a[0]
                 else:
-                    foll_a = h3.xpath('following::a[starts-with(@href, "//www.bilibili.com/video/")][1]/@href')
+                    foll_a = _XP_FOLL_A(h3)
                     if foll_a:
                         href = foll_a[0]
             full_url = f"https:{href}" if href and href.startswith('//') else (href or '')
             candidates.append({"title": unescape(cand_title), "url": full_url})
+        etag, modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+        if etag or modified:
+            _etag_store(query_title, (etag, modified, list(candidates), now))
     except Exception:
         candidates = []
+    return candidates
+
+
+def _rank_candidates(title: str, zh_title: str, candidates: List[Dict[str, str]]) -> List[Tuple[float, Dict[str, str]]]:
+    """[(similarity, candidate)] best first; similarity is the better of original and translated title."""
+    titles = [c.get("title") or "" for c in candidates]
+    best: Dict[int, float] = {}
+    for q in (zh_title, title):
+        for i, score in rank_similar(q, titles):
+            best[i] = max(best.get(i, 0.0), score)
+    return sorted(((score, candidates[i]) for i, score in best.items()), key=lambda x: x[0], reverse=True)
+
+
+def _similarity_gate(result: Dict[str, Any], ranked: List[Tuple[float, Dict[str, str]]],
+                     dup_lo: float, dup_hi: float) -> bool:
+    """Settle clear-cut cases without the LLM; returns True if result was decided here."""
+    top = ranked[0][0] if ranked else 0.0
+    if top < dup_lo:
+        result.update({"duplicate": False, "reason": f"候选标题相似度过低 ({top:.2f})"})
+        return True
+    if top > dup_hi:
+        result.update({"duplicate": True, "reason": f"标题高度相似 ({top:.2f})", "matched": [ranked[0][1]]})
+        return True
+    return False
+
+
+def check_duplicate(title: str, translator: Optional[AIClient] = None,
+                    cache: Optional[DiskCache] = None, cache_ttl_sec: float = 86400,
+                    dup_lo: float = 0.2, dup_hi: float = 0.85, judge_top_k: int = 5) -> Dict[str, Any]:
+    """
+    AI 判重流程：
+    1) 先将原标题翻译为中文（若 translator 提供）。
+    2) 用 lxml 抓取 B 站搜索页，收集候选 [{title,url}]。
+    3) 让 AI 判断是否为重复搬运，返回 JSON：
+       {"duplicate": bool, "reason": str, "matched": [{"title":..., "url":...}],
+        "zh_title": str, "candidates": [...]}。
+    最高相似度低于 dup_lo 直接判为不重复、高于 dup_hi 直接判为重复，均不调用 AI；
+    其余情况只把相似度最高的 judge_top_k 个候选交给 AI。
+    若提供 cache，判重结果按标题缓存 cache_ttl_sec 秒，命中时跳过网络与 AI 调用。
+    """
+    zh_title = _translate(title, translator)
+    print(f"翻译结果: {zh_title},爬取B站...")
+    query_title = zh_title or title
+
+    dup_key = _cache_key("dup", query_title)
+    if cache is not None:
+        hit = cache.get(dup_key)
+        if hit is not None:
+            print("判重缓存命中")
+            return hit
+
+    candidates = search_bilibili(query_title)
 
     result: Dict[str, Any] = {"duplicate": False, "reason": "", "matched": [], "zh_title": query_title, "candidates": candidates}
-    if translator:
+    ranked = _rank_candidates(title, query_title, candidates)
+    # 只缓存由相似度闸门或 AI 真正给出的结论；没有 translator 时的默认“不重复”不能缓存
+    decided = _similarity_gate(result, ranked, dup_lo, dup_hi)
+    if not decided and translator:
         try:
             print("AI 判重...")
-            verdict = translator.judge_duplicate(original_title=title, zh_title=query_title, candidates=candidates)
+            verdict = translator.judge_duplicate(original_title=title, zh_title=query_title,
+                                                 candidates=[c for _, c in ranked[:judge_top_k]])
             # 合并 verdict
             result.update({k: v for k, v in verdict.items() if k in ("duplicate", "reason", "matched")})
+            decided = not verdict.get("failed")
         except Exception as e:
             result["reason"] = f"AI 判重失败: {e}"
+    if decided and cache is not None and candidates:
+        cache.set(dup_key, result, expire=cache_ttl_sec)
     return result
+
+
+def check_duplicate_batch(titles: List[str], translator: Optional[AIClient] = None,
+                          cache: Optional[DiskCache] = None, cache_ttl_sec: float = 86400,
+                          dup_lo: float = 0.2, dup_hi: float = 0.85, judge_top_k: int = 5,
+                          pool_query: Optional[str] = None, pool_top_k: int = 10) -> List[Dict[str, Any]]:
+    """
+    与 check_duplicate 相同的判重（含 dup_lo/dup_hi 相似度闸门），但一组标题只发起一次 AI 请求。
+    若提供 pool_query（如本批次的搜索关键词），在第一个未命中判重缓存的标题处搜索一次 B 站作为共享候选池
+    并建立倒排索引，每个标题取池中前 pool_top_k 个候选；池中已有相似度高于 dup_hi 的候选时不再单独搜索该标题。
+    全部命中缓存时不发起任何请求。
+    返回结果与 titles 按下标对齐。
+    """
+    results: List[Dict[str, Any]] = []
+    pending: List[int] = []
+    shortlists: List[List[Dict[str, str]]] = []
+    index: Optional[CandidateIndex] = None
+    for title in titles:
+        zh_title = _translate(title, translator)
+        print(f"翻译结果: {zh_title},爬取B站...")
+        query_title = zh_title or title
+        hit = cache.get(_cache_key("dup", query_title)) if cache is not None else None
+        if hit is not None:
+            print("判重缓存命中")
+            results.append(hit)
+            continue
+        if index is None and pool_query:
+            # 延迟到第一个缓存未命中的标题才抓取候选池，全部命中缓存时不多发请求
+            print(f"爬取B站候选池: {pool_query}")
+            index = CandidateIndex(search_bilibili(pool_query))
+        pool_hits: List[Dict[str, str]] = []
+        if index is not None:
+            seen_urls: Set[str] = set()
+            for c in index.top(query_title, pool_top_k) + index.top(title, pool_top_k):
+                if c.get("url") not in seen_urls:
+                    seen_urls.add(c.get("url") or "")
+                    pool_hits.append(c)
+        ranked = _rank_candidates(title, query_title, pool_hits)
+        if ranked and ranked[0][0] > dup_hi:
+            candidates = pool_hits
+        else:
+            candidates = search_bilibili(query_title)
+            urls = {c.get("url") for c in candidates}
+            candidates += [c for c in pool_hits if c.get("url") not in urls]
+            ranked = _rank_candidates(title, query_title, candidates)
+        result: Dict[str, Any] = {"duplicate": False, "reason": "", "matched": [], "zh_title": query_title, "candidates": candidates}
+        results.append(result)
+        if _similarity_gate(result, ranked, dup_lo, dup_hi):
+            if cache is not None and candidates:
+                cache.set(_cache_key("dup", query_title), result, expire=cache_ttl_sec)
+            continue
+        pending.append(len(results) - 1)
+        shortlists.append([c for _, c in ranked[:judge_top_k]])
+
+    if translator and pending:
+        items = [{"orig": titles[i], "zh": results[i]["zh_title"], "candidates": shortlist}
+                 for i, shortlist in zip(pending, shortlists)]
+        try:
+            print(f"AI 批量判重 ({len(items)} 条)...")
+            verdicts = translator.judge_duplicates_batch(items)
+        except Exception as e:
+            for i in pending:
+                results[i]["reason"] = f"AI 判重失败: {e}"
+            return results
+        for i, verdict in zip(pending, verdicts):
+            results[i].update({k: v for k, v in verdict.items() if k in ("duplicate", "reason", "matched")})
+            if verdict.get("failed"):
+                # 与异常分支一致：没有得到有效结论，不写缓存
+                continue
+            if cache is not None and results[i]["candidates"]:
+                cache.set(_cache_key("dup", results[i]["zh_title"]), results[i], expire=cache_ttl_sec)
+    return results
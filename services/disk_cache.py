@@ -0,0 +1,64 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+import orjson
+
+"""
+Tiny persistent key/value cache with per-entry TTL, backed by SQLite.
+用于跨运行复用 B 站判重等昂贵结果；值以 JSON 存储。
+"""
+
+
+class DiskCache:
+    def __init__(self, directory: str, default_ttl: Optional[float] = None):
+        p = Path(directory)
+        p.mkdir(parents=True, exist_ok=True)
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        # 多个工作线程共用同一连接，由 _lock 串行化
+        self._conn = sqlite3.connect(str(p / "cache.sqlite"), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, ts REAL NOT NULL, expire REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expire FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return default
+            value, expire = row
+            if expire is not None and expire < time.time():
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return default
+        try:
+            return orjson.loads(value)
+        except ValueError:
+            return default
+
+    def set(self, key: str, value: Any, expire: Optional[float] = None) -> None:
+        """Store value for expire seconds (default_ttl when omitted; None there means no expiry).
+        A TTL <= 0 disables caching: nothing is stored and any existing entry is removed.
+        """
+        ttl = self.default_ttl if expire is None else expire
+        if ttl is not None and ttl <= 0:
+            with self._lock:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+            return
+        now = time.time()
+        data = orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, ts, expire) VALUES (?, ?, ?, ?)",
+                (key, data, now, (now + ttl) if ttl is not None else None),
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
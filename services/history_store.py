@@ -1,30 +1,347 @@
-import json
+import mmap
+import atexit
+import time
+import queue
+import hashlib
+import sqlite3
+import threading
 from pathlib import Path
-from typing import Set, Dict, Any
+from typing import Set, FrozenSet, Dict, List, Tuple, Any, Iterable, Iterator, Optional, BinaryIO
 
+import orjson
 
-def load_history_ids(file_path: str) -> Set[str]:
-    p = Path(file_path)
-    if not p.exists():
-        return set()
-    ids: Set[str] = set()
-    with p.open("r", encoding="utf-8", errors="ignore") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
+try:
+    from isal import igzip as _gzip  # python-isal: SIMD 加速的 gzip，接口与 gzip 模块一致
+except ImportError:
+    import gzip as _gzip
+
+try:
+    import simdjson  # pysimdjson: 按需取字段，不构造完整 dict
+except ImportError:
+    simdjson = None
+
+
+def _is_gz(path: Path) -> bool:
+    return path.suffix == ".gz"
+
+
+def _gz_member(data: bytes) -> bytes:
+    # 每次追加写成独立的 gzip member；多个 member 首尾相接仍是合法 gzip，读取时自动连续解压
+    return _gzip.compress(data, compresslevel=1)
+
+
+def _dumps_line(record: Dict[str, Any]) -> bytes:
+    """One JSONL record as UTF-8 bytes, newline included."""
+    return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS)
+
+
+def _simdjson_id(parser: Any, line: bytes) -> Optional[str]:
+    # doc 只存活在本函数内：返回前取出 str 并释放 doc，否则 Parser 拒绝再次 parse（RuntimeError）
+    doc = parser.parse(line)
+    try:
+        for pointer in ("/yt_id", "/id"):
             try:
-                obj = json.loads(line)
-                vid = obj.get("yt_id") or obj.get("id")
-                if vid:
-                    ids.add(str(vid))
+                vid = doc.at_pointer(pointer)
             except Exception:
+                # 缺少该字段，或该行不是 JSON 对象
+                continue
+            if vid and isinstance(vid, (str, int, float)):
+                return str(vid)
+        return None
+    finally:
+        del doc
+
+
+def _simdjson_ids(lines: Iterable[bytes]) -> Iterable[str]:
+    # 复用同一个 Parser 及其内部缓冲
+    parser = simdjson.Parser()
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            vid = _simdjson_id(parser, line)
+        except ValueError:
+            continue
+        except RuntimeError:
+            # Parser 仍被占用时换一个新的，保证不因此中断整个读取
+            parser = simdjson.Parser()
+            try:
+                vid = _simdjson_id(parser, line)
+            except (ValueError, RuntimeError):
                 continue
+        if vid:
+            yield vid
+
+
+# file_path -> (st_size, st_mtime_ns, 已解析到的（解压后）字节偏移, ids)
+# 历史文件只追加，文件变长时只读取新增的尾部；变短（被截断/轮转）时整体重读
+_ids_cache: Dict[str, Tuple[int, int, int, FrozenSet[str]]] = {}
+_ids_cache_lock = threading.Lock()
+
+
+def _iter_ids(lines: Iterable[bytes]) -> Iterator[str]:
+    # 以字节读取，orjson 直接解析 bytes，省去逐行解码
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = orjson.loads(line)
+        except ValueError:
+            # orjson.JSONDecodeError（含 UTF-8 解码错误）是 ValueError 的子类
+            continue
+        if not isinstance(obj, dict):
+            continue
+        vid = obj.get("yt_id") or obj.get("id")
+        if vid:
+            yield str(vid)
+
+
+def _parse_ids(lines: Iterable[bytes]) -> Set[str]:
+    # 由 set() 一次性消费生成器，避免逐个 .add 的属性查找与调用
+    return set(_simdjson_ids(lines) if simdjson is not None else _iter_ids(lines))
+
+
+def _complete_lines(f: BinaryIO, consumed: List[int]) -> Iterable[bytes]:
+    try:
+        for line in f:
+            if not line.endswith(b"\n") and line.strip():
+                # 末尾没有换行的行：能完整解析（如手工编辑后缺少结尾换行）就照常计入；
+                # 解析失败则可能仍在写入中，留到下次再读
+                try:
+                    orjson.loads(line)
+                except ValueError:
+                    return
+            consumed[0] += len(line)
+            yield line
+    except EOFError:
+        # .gz 末尾的 member 尚未写完
+        return
+
+
+def load_history_ids(file_path: str) -> FrozenSet[str]:
+    """Ids recorded in a JSONL history file (gzip-compressed if the name ends in ``.gz``).
+
+    Results are cached per path. Later calls only parse the bytes appended since the
+    previous call; the file is rescanned if it shrank. For ``.gz`` files the skipped
+    prefix is still decompressed, but not parsed. The result is a frozenset, so
+    callers that need to mutate it should copy it.
+    """
+    p = Path(file_path)
+    try:
+        st = p.stat()
+    except FileNotFoundError:
+        return frozenset()
+    with _ids_cache_lock:
+        size, mtime_ns, offset, ids = _ids_cache.get(file_path, (0, 0, 0, frozenset()))
+    if st.st_size == size and st.st_mtime_ns == mtime_ns:
+        return ids
+    if st.st_size <= size:
+        offset, ids = 0, frozenset()
+    new_ids, offset = _read_ids_from(p, offset)
+    if new_ids - ids:
+        ids = ids | new_ids
+    with _ids_cache_lock:
+        _ids_cache[file_path] = (st.st_size, st.st_mtime_ns, offset, ids)
     return ids
 
 
+def _read_ids_from(p: Path, offset: int) -> Tuple[Set[str], int]:
+    """Parse ids from the (decompressed) byte ``offset`` on; returns them and the new offset."""
+    consumed = [0]
+    with (_gzip.open(p, "rb") if _is_gz(p) else p.open("rb")) as f:
+        f.seek(offset)
+        ids = _parse_ids(_complete_lines(f, consumed))
+    return ids, offset + consumed[0]
+
+
+# 每个历史文件只打开一次，后续追加复用同一句柄；进程退出时统一 close
+_handles: Dict[str, BinaryIO] = {}
+_handles_lock = threading.Lock()
+
+
+def _close_handles() -> None:
+    with _handles_lock:
+        for f in _handles.values():
+            try:
+                f.close()
+            except Exception:
+                pass
+        _handles.clear()
+
+
+atexit.register(_close_handles)
+
+
 def append_history(file_path: str, record: Dict[str, Any]) -> None:
-    p = Path(file_path)
-    p.parent.mkdir(parents=True, exist_ok=True)
-    with p.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    """Append one record. For ``.gz`` paths each call writes its own gzip member."""
+    line = _dumps_line(record)
+    if _is_gz(Path(file_path)):
+        line = _gz_member(line)
+    with _handles_lock:
+        f = _handles.get(file_path)
+        if f is None:
+            p = Path(file_path)
+            p.parent.mkdir(parents=True, exist_ok=True)
+            f = _handles[file_path] = p.open("ab", buffering=1 << 16)
+        f.write(line)
+        # 每条记录立即落盘：同进程内 load_history_ids 能看到它，崩溃时也不会丢失去重记录
+        f.flush()
+
+
+class HistoryAppender:
+    """Append history records from many threads through one writer thread.
+
+    Records queued within ``flush_interval`` seconds are written together with a single
+    write on a handle that stays open (one gzip member per batch for ``.gz`` paths);
+    call close() to drain the queue before exit.
+    """
+
+    def __init__(self, file_path: str, flush_interval: float = 0.2):
+        p = Path(file_path)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        self._gz = _is_gz(p)
+        self._f = p.open("ab")
+        self._q: "queue.Queue[Optional[bytes]]" = queue.Queue()
+        self._interval = flush_interval
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        self._q.put(_dumps_line(record))
+
+    def _run(self) -> None:
+        while True:
+            first = self._q.get()
+            stop = first is None
+            batch = [] if stop else [first]
+            if not stop:
+                # 稍等片刻，把同一时段的记录合并成一次写入
+                time.sleep(self._interval)
+            while not stop:
+                try:
+                    nxt = self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                else:
+                    batch.append(nxt)
+            if batch:
+                try:
+                    data = b"".join(batch)
+                    self._f.write(_gz_member(data) if self._gz else data)
+                    self._f.flush()
+                except Exception as e:
+                    print(f"写入历史记录失败: {e}")
+            if stop:
+                return
+
+    def close(self) -> None:
+        self._q.put(None)
+        self._thread.join()
+        self._f.close()
+
+
+class HistoryStore:
+    """Set-like view of processed video ids for one history file.
+
+    A Bloom filter (``<history>.bloom``, memory-mapped) answers most negative lookups
+    without touching disk; positives are confirmed in ``<history>.sqlite``.
+    The JSONL history stays the source of truth: on open, lines appended since the last
+    sync are folded in, and both indexes are rebuilt when the JSONL shrank or was rewritten
+    (e.g. a line was deleted to retry a video) or when they are missing.
+    """
+
+    _HASHES = 7
+
+    def __init__(self, history_file: str, min_bits: int = 1 << 20):
+        p = Path(history_file)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        db_path = p.with_suffix(".sqlite")
+        bloom_path = p.with_suffix(".bloom")
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS ids (id TEXT PRIMARY KEY)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        rebuild, new_ids = self._sync(p)
+        count = self._db.execute("SELECT COUNT(*) FROM ids").fetchone()[0]
+        # ~16 bits per entry keeps the false-positive rate well under 1% with 7 hashes
+        want_bits = max(min_bits, count * 16)
+        if rebuild or not bloom_path.exists() or bloom_path.stat().st_size * 8 < count * 10:
+            self._write_bloom(bloom_path, want_bits)
+            new_ids = set()
+        self._bloom_file = open(bloom_path, "r+b")
+        self._bloom = mmap.mmap(self._bloom_file.fileno(), 0)
+        self._nbits = len(self._bloom) * 8
+        for vid in new_ids:
+            self._set_bits(vid)
+
+    def _sync(self, p: Path) -> Tuple[bool, Set[str]]:
+        """Bring the ids table up to date with the JSONL; returns (rebuilt, ids read from the tail)."""
+        meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        try:
+            st = p.stat()
+            size, mtime_ns = st.st_size, st.st_mtime_ns
+        except FileNotFoundError:
+            size, mtime_ns = 0, 0
+        if "size" in meta and size == meta["size"] and mtime_ns == meta["mtime_ns"]:
+            return False, set()
+        # 变短或等长但被改写：以 JSONL 为准整体重建；变长：只读取上次同步之后追加的部分
+        rebuild = "size" not in meta or size <= meta["size"]
+        offset = 0 if rebuild else meta["offset"]
+        ids, offset = _read_ids_from(p, offset) if size else (set(), 0)
+        if rebuild:
+            self._db.execute("DELETE FROM ids")
+        self._db.executemany("INSERT OR IGNORE INTO ids (id) VALUES (?)", ((vid,) for vid in ids))
+        self._db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                             (("size", size), ("mtime_ns", mtime_ns), ("offset", offset)))
+        self._db.commit()
+        return rebuild, ids
+
+    def _write_bloom(self, path: Path, nbits: int) -> None:
+        nbytes = (nbits + 7) // 8
+        bits = bytearray(nbytes)
+        for (vid,) in self._db.execute("SELECT id FROM ids"):
+            for pos in self._positions(vid, nbytes * 8):
+                bits[pos >> 3] |= 1 << (pos & 7)
+        with open(path, "wb") as f:
+            f.write(bits)
+
+    @classmethod
+    def _positions(cls, vid: str, nbits: int) -> Iterable[int]:
+        d = hashlib.blake2b(vid.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        return ((h1 + i * h2) % nbits for i in range(cls._HASHES))
+
+    def __contains__(self, vid: object) -> bool:
+        if not vid:
+            return False
+        key = str(vid)
+        with self._lock:
+            for pos in self._positions(key, self._nbits):
+                if not self._bloom[pos >> 3] & (1 << (pos & 7)):
+                    return False
+            return self._db.execute("SELECT 1 FROM ids WHERE id = ?", (key,)).fetchone() is not None
+
+    def _set_bits(self, key: str) -> None:
+        for pos in self._positions(key, self._nbits):
+            self._bloom[pos >> 3] |= 1 << (pos & 7)
+
+    def add(self, vid: str) -> None:
+        if not vid:
+            return
+        key = str(vid)
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO ids (id) VALUES (?)", (key,))
+            self._db.commit()
+            self._set_bits(key)
+
+    def close(self) -> None:
+        with self._lock:
+            self._bloom.flush()
+            self._bloom.close()
+            self._bloom_file.close()
+            self._db.close()
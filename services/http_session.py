@@ -0,0 +1,25 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Iterable, Optional
+
+"""
+Shared construction of pooled requests.Session objects (keep-alive + retry).
+"""
+
+
+def build_session(pool_connections: int = 10, pool_maxsize: int = 10, retries: int = 3,
+                  backoff_factor: float = 0.5,
+                  status_forcelist: Iterable[int] = (429, 500, 502, 503, 504),
+                  headers: Optional[Dict[str, str]] = None) -> requests.Session:
+    s = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=list(status_forcelist)),
+    )
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    if headers:
+        s.headers.update(headers)
+    return s
@@ -1,10 +1,13 @@
-from typing import Dict
+from typing import Dict, Optional
 from .ai_client import AIClient
+from .disk_cache import DiskCache
 
 
 class AITitleTagger:
-    def __init__(self, base_url: str, api_key: str, model: str = "gpt-4o-mini"):
-        self.client = AIClient(base_url=base_url, api_key=api_key, model=model)
+    def __init__(self, base_url: str, api_key: str, model: str = "gpt-4o-mini",
+                 cache: Optional[DiskCache] = None, cache_ttl_sec: float = 7 * 86400):
+        self.client = AIClient(base_url=base_url, api_key=api_key, model=model,
+                               cache=cache, cache_ttl_sec=cache_ttl_sec)
 
     def generate(self, original_title: str, cn_subs: str) -> Dict:
         return self.client.generate_title_tags(original_title, cn_subs)
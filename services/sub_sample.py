@@ -0,0 +1,55 @@
+import re
+from typing import List, Tuple
+
+"""
+Cheap extractive sampling of SRT subtitles for LLM prompts.
+保留开头与结尾若干条字幕，中间按步长抽样，使总长度落在字节预算内。
+"""
+
+_CUE_RE = re.compile(r"\d+\n(\d\d:\d\d:\d\d,\d+)\s-->\s(\d\d:\d\d:\d\d,\d+)\n(.*?)(?=\n\n|\Z)", re.S)
+
+
+def parse_srt(text: str) -> List[Tuple[str, str, str]]:
+    """Return [(start, end, body)]; multi-line bodies are joined with spaces."""
+    text = text.replace("\r\n", "\n").strip()
+    cues = []
+    for m in _CUE_RE.finditer(text):
+        body = " ".join(line.strip() for line in m.group(3).splitlines() if line.strip())
+        if body:
+            cues.append((m.group(1), m.group(2), body))
+    return cues
+
+
+def _clip(s: str, max_bytes: int) -> str:
+    return s.encode("utf-8")[:max(0, max_bytes)].decode("utf-8", errors="ignore")
+
+
+def sample_srt(text: str, target_bytes: int = 2500, keep: int = 8) -> str:
+    """Shrink subtitles to about target_bytes (UTF-8).
+    Text already within budget is returned unchanged; otherwise only cue bodies are kept:
+    the first and last `keep` cues plus an evenly strided sample of the middle.
+    """
+    if len(text.encode("utf-8")) <= target_bytes:
+        return text
+    bodies = [body for _, _, body in parse_srt(text)]
+    if not bodies:
+        # 不是 SRT 格式：退化为按字节截断
+        return _clip(text, target_bytes)
+    if len(bodies) <= keep * 2:
+        return _clip("\n".join(bodies), target_bytes)
+
+    head, middle, tail = bodies[:keep], bodies[keep:-keep], bodies[-keep:]
+    used = sum(len(b.encode("utf-8")) + 1 for b in head + tail)
+    remaining = target_bytes - used
+    sampled: List[str] = []
+    if remaining > 0 and middle:
+        avg = max(1, sum(len(b.encode("utf-8")) + 1 for b in middle) // len(middle))
+        n = max(1, remaining // avg)
+        stride = max(1, -(-len(middle) // n))
+        for b in middle[::stride]:
+            size = len(b.encode("utf-8")) + 1
+            if size > remaining:
+                break
+            sampled.append(b)
+            remaining -= size
+    return _clip("\n".join(head + sampled + tail), target_bytes)
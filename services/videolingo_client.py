@@ -1,10 +1,28 @@
 import time
-import requests
-from typing import Optional, Dict, Any
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Iterator
+
+import orjson
+
+from .http_session import build_session
+
 
 class VideoLingoClient:
     def __init__(self, base_url: str):
         self.base = base_url.rstrip('/')
+        # 端点 URL 只拼接一次，调用时用 % 填入 task_id
+        self._process_url = f"{self.base}/api/v1/process-url"
+        tmpl_base = self.base.replace("%", "%%")
+        self._task_tmpl = f"{tmpl_base}/api/v1/tasks/%s"
+        self._dl_tmpl = f"{tmpl_base}/api/v1/download/%s/%s"
+        # 长时间轮询与分片下载复用同一连接池，避免每次请求重新握手
+        self.session = build_session(pool_connections=4, pool_maxsize=16, retries=3, backoff_factor=0.5,
+                                     status_forcelist=(502, 503, 504))
+        # 已结束（completed/failed）的任务状态不会再变，缓存后不再请求
+        self._final_status: Dict[str, Dict[str, Any]] = {}
+        self._status_lock = threading.Lock()
 
     def process_url(self, url: str, target_language: str = "简体中文", source_language: Optional[str] = None,
                     enable_dubbing: bool = False, burn_subtitles: bool = True, resolution: str = "1080") -> str:
@@ -16,17 +34,69 @@ class VideoLingoClient:
             "burn_subtitles": burn_subtitles,
             "resolution": resolution,
         }
-        r = requests.post(f"{self.base}/api/v1/process-url", json=payload, timeout=60)
+        r = self.session.post(self._process_url, json=payload, timeout=60)
         r.raise_for_status()
-        return r.json()["task_id"]
+        return orjson.loads(r.content)["task_id"]
 
     def get_status(self, task_id: str) -> Dict[str, Any]:
-        r = requests.get(f"{self.base}/api/v1/tasks/{task_id}", timeout=30)
+        with self._status_lock:
+            cached = self._final_status.get(task_id)
+        if cached is not None:
+            return cached
+        r = self.session.get(self._task_tmpl % task_id, timeout=30)
         r.raise_for_status()
-        return r.json()
+        s = orjson.loads(r.content)
+        if s.get("status") in ("completed", "failed"):
+            with self._status_lock:
+                self._final_status[task_id] = s
+        return s
+
+    def stream_status(self, task_id: str, idle_timeout_sec: float = 120,
+                      deadline: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """Yield status dicts pushed by the server as Server-Sent Events (``data: {...}``).
+        Ends quietly when the server has no event stream for the task (404/415, plain JSON reply),
+        the connection drops, or time.time() passes ``deadline``; callers should then fall back
+        to polling get_status.
+        """
+        url = self._task_tmpl % task_id
+        try:
+            r = self.session.get(url, stream=True, headers={"Accept": "text/event-stream"},
+                                 timeout=(10, idle_timeout_sec))
+        except Exception:
+            return
+        with r:
+            if r.status_code != 200 or not r.headers.get("Content-Type", "").startswith("text/event-stream"):
+                return
+            data_lines = []
+            try:
+                # chunk_size=1：事件很小，按默认 512 字节分块会把事件（及心跳）攒到凑满一块才交出
+                for line in r.iter_lines(chunk_size=1, decode_unicode=True):
+                    # 每行都检查截止时间：服务端只发心跳注释（": ping"）时不会有事件产出，空闲超时也不会触发
+                    if deadline is not None and time.time() > deadline:
+                        return
+                    if line is None:
+                        continue
+                    if line == "":
+                        # 空行结束一个事件
+                        if data_lines:
+                            try:
+                                yield orjson.loads("\n".join(data_lines))
+                            except ValueError:
+                                pass
+                            data_lines = []
+                        continue
+                    if line.startswith("data:"):
+                        data_lines.append(line[5:].lstrip())
+            except Exception:
+                return
 
-    def wait_until_done(self, task_id: str, poll_sec: int = 10, timeout_sec: int = 36000) -> Dict[str, Any]:
+    def wait_until_done(self, task_id: str, poll_sec: Optional[float] = None, timeout_sec: int = 36000,
+                        max_poll_sec: float = 30.0) -> Dict[str, Any]:
+        """Poll until the task finishes. The interval starts at poll_sec (default 1s) and grows
+        by 1.5x up to max_poll_sec, so short jobs are noticed quickly and long ones poll rarely.
+        """
         start = time.time()
+        delay = float(poll_sec) if poll_sec is not None else 1.0
         while True:
             s = self.get_status(task_id)
             st = s.get("status")
@@ -34,20 +104,65 @@ class VideoLingoClient:
                 return s
             if time.time() - start > timeout_sec:
                 raise TimeoutError("Video processing timeout")
-            time.sleep(poll_sec)
+            time.sleep(delay)
+            delay = min(delay * 1.5, max_poll_sec)
 
     def download_file(self, task_id: str, file_type: str, out_path: str) -> str:
         # file_type: video_sub | video_dub | src_srt | trans_srt | dub_audio
-        url = f"{self.base}/api/v1/download/{task_id}/{file_type}"
-        r = requests.get(url, timeout=120)
-        r.raise_for_status()
+        url = self._dl_tmpl % (task_id, file_type)
+        # 流式写盘：内存占用与文件大小无关
+        with self.session.get(url, stream=True, timeout=(10, 600)) as r:
+            r.raise_for_status()
+            r.raw.decode_content = True
+            with open(out_path, "wb") as f:
+                shutil.copyfileobj(r.raw, f, length=1024 * 1024)
+        return out_path
+
+    def download_file_ranged(self, task_id: str, file_type: str, out_path: str,
+                             concurrency: int = 4, chunk_mb: int = 8) -> str:
+        """Download with parallel HTTP Range requests when the server supports them.
+        Falls back to download_file for small files or servers without Accept-Ranges.
+        """
+        url = self._dl_tmpl % (task_id, file_type)
+        chunk = max(1, int(chunk_mb)) * 1024 * 1024
+        try:
+            h = self.session.head(url, timeout=30, allow_redirects=True)
+            size = int(h.headers.get("Content-Length") or 0)
+            ranged = h.ok and h.headers.get("Accept-Ranges", "").lower() == "bytes"
+        except Exception:
+            size, ranged = 0, False
+        if not ranged or size <= chunk:
+            return self.download_file(task_id, file_type, out_path)
+
         with open(out_path, "wb") as f:
-            f.write(r.content)
+            f.truncate(size)
+
+        def fetch(start: int) -> None:
+            end = min(start + chunk, size) - 1
+            r = self.session.get(url, headers={"Range": f"bytes={start}-{end}"}, timeout=120)
+            r.raise_for_status()
+            if r.status_code != 206 or len(r.content) != end - start + 1:
+                raise IOError(f"Unexpected range response for bytes {start}-{end}")
+            # 每个分片各自打开文件写入对应偏移，不共享文件指针
+            with open(out_path, "r+b") as f:
+                f.seek(start)
+                f.write(r.content)
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, int(concurrency))) as pool:
+                for fut in [pool.submit(fetch, start) for start in range(0, size, chunk)]:
+                    fut.result()
+        except Exception as e:
+            # 任一分片失败（非 206、长度不符、网络抖动）时整文件重新下载，覆盖已预分配的文件
+            print(f"分片下载失败，改为整文件下载: {e}")
+            return self.download_file(task_id, file_type, out_path)
         return out_path
 
     def delete_task(self, task_id: str) -> bool:
+        with self._status_lock:
+            self._final_status.pop(task_id, None)
         try:
-            r = requests.delete(f"{self.base}/api/v1/tasks/{task_id}", timeout=30)
+            r = self.session.delete(self._task_tmpl % task_id, timeout=30)
             return r.status_code // 100 == 2
         except Exception:
             return False
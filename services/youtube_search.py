@@ -1,17 +1,28 @@
 import os
 import json
+import threading
 import subprocess
-from dataclasses import dataclass
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, asdict
+from itertools import chain
+from typing import List, Dict, Any, Optional, Iterable, Iterator
+
+import orjson
+
+from .disk_cache import DiskCache
+from .http_session import build_session
 
 """
 Simple YouTube search using yt-dlp (no official API). 
 It searches by keyword and returns basic metadata.
-Requirements: yt-dlp installed and accessible in PATH.
+Requirements: the yt_dlp package (searched in-process), or yt-dlp accessible in PATH.
+Set Y2B_YTDLP_SUBPROCESS=1 to always use the yt-dlp command instead of the library.
 """
 
-@dataclass
+# 不可变且无 __dict__；手写 __slots__ 而非 dataclass(slots=True)，以兼容 Python < 3.10
+@dataclass(frozen=True)
 class YouTubeVideo:
+    __slots__ = ("id", "title", "url", "duration", "uploader", "upload_date", "description")
     id: str
     title: str
     url: str
@@ -21,55 +32,290 @@ class YouTubeVideo:
     description: Optional[str]
 
 
-def search_videos(keyword: str, max_results: int = 5, region: str = "US") -> List[YouTubeVideo]:
+# cookies.txt 只在导入时检查一次，不在每次搜索时 stat
+_COOKIES_PATH: Optional[str] = "cookies.txt" if os.path.exists("cookies.txt") else None
+_BASE_CMD = ("yt-dlp", "--dump-json", "--skip-download", "--no-warnings", "--default-search", "ytsearch")
+
+SEARCH_CACHE_DIR = ".cache/yt"
+SEARCH_CACHE_TTL_SEC = 3600
+_search_cache: Optional[DiskCache] = None
+_search_cache_lock = threading.Lock()
+
+
+def _get_search_cache() -> Optional[DiskCache]:
+    global _search_cache
+    if os.environ.get("Y2B_CACHE", "").lower() == "off":
+        return None
+    with _search_cache_lock:
+        if _search_cache is None:
+            try:
+                _search_cache = DiskCache(SEARCH_CACHE_DIR, default_ttl=SEARCH_CACHE_TTL_SEC)
+            except Exception:
+                return None
+        return _search_cache
+
+
+def search_videos(keyword: str, max_results: int = 5, region: str = "US",
+                  full_metadata: bool = False) -> List[YouTubeVideo]:
+    """Search YouTube; results are cached on disk for an hour per (keyword, max_results, region, mode)."""
+    cache = _get_search_cache()
+    key = json.dumps(["search", keyword, max_results, region, full_metadata], ensure_ascii=False)
+    if cache is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            return [YouTubeVideo(**d) for d in hit]
+    videos = _search_videos(keyword, max_results=max_results, full_metadata=full_metadata, region=region)
+    if cache is not None and videos:
+        cache.set(key, [asdict(v) for v in videos])
+    return videos
+
+
+INNERTUBE_SEARCH_URL = "https://www.youtube.com/youtubei/v1/search?prettyPrint=false"
+INNERTUBE_CLIENT_VERSION = "2.20240101.00.00"
+_innertube_session = None
+_innertube_session_lock = threading.Lock()
+
+
+def _get_innertube_session():
+    global _innertube_session
+    with _innertube_session_lock:
+        if _innertube_session is None:
+            _innertube_session = build_session(pool_connections=2, pool_maxsize=8, retries=2, headers={
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                              "(KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+                "Origin": "https://www.youtube.com",
+            })
+        return _innertube_session
+
+
+def _runs_text(obj: Any) -> Optional[str]:
+    if not isinstance(obj, dict):
+        return None
+    if "simpleText" in obj:
+        return obj["simpleText"]
+    runs = obj.get("runs")
+    if runs:
+        return "".join(r.get("text", "") for r in runs)
+    return None
+
+
+def _parse_length(text: Optional[str]) -> Optional[int]:
+    # "1:02:03" / "12:34" -> 秒
+    if not text:
+        return None
+    try:
+        sec = 0
+        for part in text.split(":"):
+            sec = sec * 60 + int(part)
+        return sec
+    except ValueError:
+        return None
+
+
+def _innertube_search(keyword: str, max_results: int, region: str = "US") -> Optional[List[YouTubeVideo]]:
+    """Search through YouTube's internal web API with one HTTPS POST, no yt-dlp process.
+    Returns the same fields as --flat-playlist, or None when the request fails or the
+    response layout is not recognised (callers then fall back to yt-dlp).
+    """
+    payload = {
+        "context": {"client": {"clientName": "WEB", "clientVersion": INNERTUBE_CLIENT_VERSION,
+                               "hl": "en", "gl": region}},
+        "query": keyword,
+        "params": "EgIQAQ%3D%3D",  # 仅视频结果
+    }
+    try:
+        r = _get_innertube_session().post(INNERTUBE_SEARCH_URL, json=payload, timeout=15)
+        r.raise_for_status()
+        data = orjson.loads(r.content)
+        sections = (data["contents"]["twoColumnSearchResultsRenderer"]["primaryContents"]
+                    ["sectionListRenderer"]["contents"])
+    except Exception:
+        return None
+    videos: List[YouTubeVideo] = []
+    for section in sections:
+        for item in (section.get("itemSectionRenderer") or {}).get("contents", []):
+            v = item.get("videoRenderer")
+            if not v or not v.get("videoId"):
+                continue
+            vid = v["videoId"]
+            snippets = v.get("detailedMetadataSnippets") or []
+            videos.append(YouTubeVideo(
+                id=vid,
+                title=_runs_text(v.get("title")) or "",
+                url=f"https://www.youtube.com/watch?v={vid}",
+                duration=_parse_length(_runs_text(v.get("lengthText"))),
+                uploader=_runs_text(v.get("ownerText")),
+                upload_date=None,
+                description=_runs_text(snippets[0].get("snippetText")) if snippets else None,
+            ))
+            if len(videos) >= max_results:
+                return videos
+    return videos or None
+
+
+def search_many(keywords: List[str], max_results: int = 5, region: str = "US", workers: int = 8,
+                full_metadata: bool = False) -> List[YouTubeVideo]:
+    """Run search_videos for several keywords concurrently and merge the results.
+    Videos keep keyword order; a video found by more than one keyword appears once.
+    """
+    keywords = list(keywords)
+    if not keywords:
+        return []
+    per_kw: Dict[int, List[YouTubeVideo]] = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(keywords)))) as pool:
+        futures = {pool.submit(search_videos, kw, max_results, region, full_metadata): i
+                   for i, kw in enumerate(keywords)}
+        for fut in as_completed(futures):
+            try:
+                per_kw[futures[fut]] = fut.result()
+            except Exception as e:
+                print(f"搜索失败 {keywords[futures[fut]]}: {e}")
+    merged: Dict[str, YouTubeVideo] = {}
+    for i in range(len(keywords)):
+        for v in per_kw.get(i, []):
+            merged.setdefault(v.id, v)
+    return list(merged.values())
+
+
+class _SilentLogger:
+    def debug(self, msg: str) -> None:
+        pass
+
+    def info(self, msg: str) -> None:
+        pass
+
+    def warning(self, msg: str) -> None:
+        pass
+
+    def error(self, msg: str) -> None:
+        pass
+
+
+# 每个线程各持有自己的 YoutubeDL 实例（YoutubeDL 非线程安全），提取器只初始化一次
+_ydl_local = threading.local()
+_yt_dlp_missing = False
+
+
+def _get_ydl(full_metadata: bool):
+    global _yt_dlp_missing
+    if _yt_dlp_missing or os.environ.get("Y2B_YTDLP_SUBPROCESS", "").lower() in ("1", "true", "on"):
+        return None
+    try:
+        from yt_dlp import YoutubeDL
+    except ImportError:
+        _yt_dlp_missing = True
+        return None
+    ydls = getattr(_ydl_local, "ydls", None)
+    if ydls is None:
+        ydls = _ydl_local.ydls = {}
+    ydl = ydls.get(full_metadata)
+    if ydl is None:
+        ydl = ydls[full_metadata] = YoutubeDL({
+            "quiet": True,
+            "no_warnings": True,
+            "skip_download": True,
+            "extract_flat": not full_metadata,
+            "cookiefile": _COOKIES_PATH,
+            # 单条结果不可用/年龄限制时只跳过该条（得到 None，后面 if e 过滤），不让整次搜索失败
+            "ignoreerrors": True,
+            "noprogress": True,
+            # 与子进程路径的 stderr=DEVNULL 一致：ERROR 等输出不打印到终端
+            "logger": _SilentLogger(),
+        })
+    return ydl
+
+
+def _ytdlp_search(keyword: str, max_results: int, full_metadata: bool) -> Optional[List[YouTubeVideo]]:
+    """Search with the yt-dlp library inside this process. Returns None when yt_dlp is not
+    importable, Y2B_YTDLP_SUBPROCESS is set, or extraction fails (callers then run the CLI).
+    """
+    ydl = _get_ydl(full_metadata)
+    if ydl is None:
+        return None
+    try:
+        info = ydl.extract_info(f"ytsearch{max_results}:{keyword}", download=False)
+    except Exception as e:
+        print(f"yt-dlp 进程内搜索失败，改用子进程: {e}")
+        return None
+    if info is None:
+        # ignoreerrors 下整次搜索失败时返回 None 而不抛异常，同样交给子进程路径
+        return None
+    entries = info.get("entries") or []
+    return [_to_model(e) for e in entries if e][:max_results]
+
+
+def _search_videos(keyword: str, max_results: int, full_metadata: bool, region: str = "US") -> List[YouTubeVideo]:
+    if not full_metadata:
+        # 只需 flat 字段时先走 InnerTube 直连，省去启动 yt-dlp 进程；失败再回退
+        videos = _innertube_search(keyword, max_results, region)
+        if videos:
+            return videos
+    videos = _ytdlp_search(keyword, max_results, full_metadata)
+    if videos is not None:
+        return videos
     # yt-dlp supports ytsearchN:keyword pattern
     query = f"ytsearch{max_results}:{keyword}"
-    if os.path.exists("cookies.txt"):
-        cmd = [
-            "yt-dlp",
-            "--dump-json",
-            "--skip-download",
-            "--no-warnings",
-            "--default-search", "ytsearch",
-            "--cookies", "cookies.txt",
-            query,
-        ]
-    else:
-        cmd = [
-            "yt-dlp",
-            "--dump-json",
-            "--skip-download",
-            "--no-warnings",
-            "--default-search", "ytsearch",
-            query,
-        ]
-    proc = subprocess.run(cmd, capture_output=True, text=True, check=False)
+    # --flat-playlist 只读取搜索结果页，一次请求即可返回 id/title/duration/频道；
+    # 但不含 upload_date/description。需要这些字段（如按发布时间过滤）时传 full_metadata=True，
+    # 代价是 yt-dlp 要逐个抓取视频页，每条结果多出数秒。
+    cmd = [*_BASE_CMD]
+    if _COOKIES_PATH is not None:
+        cmd += ["--cookies", _COOKIES_PATH]
+    if not full_metadata:
+        cmd.append("--flat-playlist")
+    cmd.append(query)
+    # 边运行边逐行解析 yt-dlp 输出（NDJSON），凑够 max_results 即结束子进程
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=1024 * 1024)
     videos: List[YouTubeVideo] = []
-    if proc.returncode != 0:
-        return videos
-    for line in proc.stdout.splitlines():
+    try:
+        assert proc.stdout is not None
+        objs = _iter_objects(proc.stdout)
+        first = next(objs, None)
+        # 同一次调用里 yt-dlp 要么全输出 playlist 包装，要么全是单条视频：按首行选定循环，循环内不再判断
+        if first is not None and first.get("_type") == "playlist":
+            # When yt-dlp returns a playlist wrapper
+            for data in chain((first,), objs):
+                videos.extend(_to_model(e) for e in data.get("entries") or () if e)
+                if len(videos) >= max_results:
+                    break
+        elif first is not None:
+            for data in chain((first,), objs):
+                videos.append(_to_model(data))
+                if len(videos) >= max_results:
+                    break
+    finally:
+        if proc.poll() is None:
+            proc.terminate()
+        if proc.stdout is not None:
+            proc.stdout.close()
         try:
-            data = json.loads(line)
-        except Exception:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+    return videos[:max_results]
+
+
+def _iter_objects(lines: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+    for raw in lines:
+        try:
+            data = orjson.loads(raw)
+        except ValueError:
             continue
-        if data.get("_type") == "playlist":
-            # When yt-dlp returns a playlist wrapper
-            for entry in data.get("entries", []) or []:
-                if not entry:
-                    continue
-                videos.append(_to_model(entry))
-        else:
-            videos.append(_to_model(data))
-    return videos
+        if isinstance(data, dict):
+            yield data
 
 
 def _to_model(d: Dict[str, Any]) -> YouTubeVideo:
+    g = d.get
+    vid = g("id") or ""
     return YouTubeVideo(
-        id=d.get("id") or "",
-        title=d.get("title") or "",
-        url=d.get("webpage_url") or (f"https://www.youtube.com/watch?v={d.get('id')}") if d.get("id") else "",
-        duration=d.get("duration"),
-        uploader=d.get("uploader"),
-        upload_date=d.get("upload_date"),
-        description=d.get("description"),
+        id=vid,
+        title=g("title") or "",
+        url=g("webpage_url") or (f"https://www.youtube.com/watch?v={vid}" if vid else ""),
+        duration=g("duration"),
+        # flat 模式下常只有 channel
+        uploader=g("uploader") or g("channel"),
+        upload_date=g("upload_date"),
+        description=g("description"),
     )